@@ -2,12 +2,16 @@
 # Utilities for inspecting the layout of matplotlib plots
 import matplotlib.pyplot as plt
 import matplotlib as mpl
+import numpy as np
 from matplotlib.artist import Artist
 from matplotlib.text import Text
 from matplotlib.transforms import Bbox
 import matplotlib.patheffects as path_effects
-from matplotlib.patches import Rectangle
+from matplotlib.patches import Patch, Rectangle
+from matplotlib.lines import Line2D
+from matplotlib.collections import PatchCollection
 #from matplotlib.figure import Figure
+from types import MappingProxyType
 
 def add_outline(artist: mpl.artist.Artist, color = 'k', linewidth = 1):
     """
@@ -21,9 +25,25 @@ def add_outline(artist: mpl.artist.Artist, color = 'k', linewidth = 1):
 ################
 # Debug Inspection
 ################
-def describe_artist(artist: mpl.artist.Artist, coords = 'pixels') -> str:
+def layout_context(fig: mpl.figure.Figure) -> dict:
+    """
+    Precomputes the figure-level values needed to describe artists in coordinates other than pixels, so that they can be shared across many describe_artist calls.
+    Returns (multiplier, divisor) pairs for converting pixel bounds (x, y, width, height) into each coordinate system.
+    """
+    dpi = fig.dpi
+    w, h = fig.get_figwidth() * dpi, fig.get_figheight() * dpi
+    return {
+        'inches': (1, dpi),
+        'points': (72, dpi),
+        'fraction': (1, np.array([w, h, w, h])),
+    }
+
+def describe_artist(artist: mpl.artist.Artist, coords = 'pixels', context = None) -> str:
     """
     Describes an Artist and its position and size within a figure.
+
+    Parameters:
+        - context: optional result of layout_context for the artist's figure. Saves recomputing figure dpi and size when describing many artists.
     """
     bounds = artist.get_window_extent()
     artist_type = str(type(artist)).split('.')[-1][:-2]
@@ -31,21 +51,12 @@ def describe_artist(artist: mpl.artist.Artist, coords = 'pixels') -> str:
     if isinstance(artist, Text):
         artist_type += f":'{artist.get_text()}'"
     if coords != 'pixels':
-        f = artist.figure
-        if coords == 'inches':
-            bounds = Bbox.from_bounds(*[x / f.dpi for x in bounds.bounds]) 
-        elif coords == 'points':
-            bounds = Bbox.from_bounds(*[72 * x / f.dpi for x in bounds.bounds])
-        elif coords == 'fraction':
-            w, h = f.get_figwidth() * f.dpi, f.get_figheight() * f.dpi
-            figbounds = list(bounds.bounds)
-            figbounds[0] /= w
-            figbounds[1] /= h
-            figbounds[2] /= w
-            figbounds[3] /= h            
-            bounds = Bbox.from_bounds(*figbounds) 
-        else:
+        if coords not in ('inches', 'points', 'fraction'):
             raise ValueError('coords must be one of: pixels | inches | points | fraction')
+        if context is None:
+            context = layout_context(artist.figure)
+        multiplier, divisor = context[coords]
+        bounds = Bbox.from_bounds(*(multiplier * np.asarray(bounds.bounds) / divisor))
 
     if coords in (['pixels', 'points']):
         bounds_str = f'xy = ({round(bounds.x0)}, {round(bounds.y0)}), width = {round(bounds.width)}, height = {round(bounds.height)}'
@@ -54,24 +65,49 @@ def describe_artist(artist: mpl.artist.Artist, coords = 'pixels') -> str:
     return f'{artist_type}({bounds_str})'
 
 # Artist hierarchy inspection - debug logging
+# Artist types that never have children, so iter_layout can skip calling get_children on them
+_LEAF_TYPES = (Text, Patch, Line2D)
+
+def iter_layout(artist: mpl.artist.Artist, depth = 0, index = 0):
+    """
+    Iterates through the Artist hierarchy depth-first, yielding (artist, depth, index) for each Artist.
+    """
+    # Depth-first traversal with an explicit stack so that deep hierarchies don't hit the recursion limit.
+    # Children are pushed in reverse so that they are visited in their natural order.
+    stack = [(artist, depth, index)]
+    while stack:
+        artist, depth, index = stack.pop()
+        yield artist, depth, index
+        if not isinstance(artist, _LEAF_TYPES):
+            children = artist.get_children()
+            stack.extend((child, depth + 1, index) for index, child in reversed(list(enumerate(children))))
+
 def traverse_layout(artist: mpl.artist.Artist, handler = lambda artist, depth, index: None, depth = 0, index = 0):
     """
     Base layout inspection method that iterates through the Artist hierarchy and emits a callback on each Artist.
     """
-    handler(artist, depth, index)
-    for index, child in enumerate(artist.get_children()):
-        traverse_layout(child, handler, depth = depth + 1, index = index)
+    for artist, depth, index in iter_layout(artist, depth, index):
+        handler(artist, depth, index)
 
 def print_layout(artist: mpl.artist.Artist, coords = 'pixels'):
     """
     Layout inspection utility that debug-prints an artist hierarchy to the console
     """
-    def handle_artist(artist, depth, index):
-        artist_description = describe_artist(artist, coords = coords)
+    # Figure dpi and size are constant across the hierarchy, so look them up once rather than per artist
+    context = layout_context(artist.figure) if coords != 'pixels' else None
+    for child, depth, index in iter_layout(artist):
+        artist_description = describe_artist(child, coords = coords, context = context)
         print('| ' * depth + f'{index+1}. ' + artist_description)
-    traverse_layout(artist, handle_artist)
 
 # Artist Hierarchy Inspection - Visual
+# Shared, read-only default style for debug boxes
+_DEFAULT_DEBUG_STYLE = MappingProxyType({ 'edgecolor': ('k', 0.5), 'linestyle': '--', 'linewidth': 1, 'facecolor': 'none' })
+# Style properties that PatchCollection(match_original = True) carries over from each of its patches
+_COLLECTION_STYLE_KEYS = frozenset({
+    'color', 'edgecolor', 'ec', 'facecolor', 'fc', 'fill', 'alpha',
+    'linewidth', 'lw', 'linestyle', 'ls', 'antialiased', 'aa',
+})
+
 def add_debug_box(
     box: Bbox, 
     fig: mpl.figure.Figure,
@@ -79,8 +115,8 @@ def add_debug_box(
     #facecolor = 'none', edgecolor = ('k', 0.5), linestyle = '--', linewidth = 1
     #style = { 'edgecolor': ('k', 0.5), 'linestyle': '--', 'linewidth': 1, 'facecolor': 'none' }
 ):
-    if style == {}:
-        style = { 'edgecolor': ('k', 0.5), 'linestyle': '--', 'linewidth': 1, 'facecolor': 'none' }
+    if not style:
+        style = _DEFAULT_DEBUG_STYLE
     rect = Rectangle((box.x0, box.y0), box.width, box.height, **style)
     #rect.set_facecolor(facecolor)
     #rect.set_edgecolor(edgecolor)
@@ -92,33 +128,26 @@ def show_layout(
     artist: mpl.artist.Artist, 
     depth = 0,
     renderer = None, # Used to compute bounding boxes
-    handler = lambda artist: { 'edgecolor': ('k', 0.5), 'linestyle': '--', 'linewidth': 1, 'facecolor': 'none' }
+    handler = lambda artist: _DEFAULT_DEBUG_STYLE
 ):
     """
     Layout inspection utility that adds outlines to chart elements to reveal underlying layout details.
     """
-    def handle_artist(artist, depth, index):
-        #facecolor = style.get('facecolor')
-        #edgecolor = style.get('edgecolor')
-        #linewidth = style.get('linewidth')
-        #linestyle = style.get('linestyle')
-        bbox = artist.get_window_extent(renderer)
-        style = handler(artist)
-        add_debug_box(
-            bbox,
-            artist.get_figure(),
-            **style
-        )
-        # if hasattr(artist, 'set_bbox'):
-        #     artist.set_bbox(style)
-        # if hasattr(artist, 'set_facecolor') and facecolor:
-        #     if not artist.get_facecolor():
-        #         artist.set_facecolor(facecolor)
-        # if hasattr(artist, 'set_edgecolor') and edgecolor:
-        #     if not artist.get_edgecolor():
-        #         artist.set_edgecolor(edgecolor)
-        #         if linestyle:
-        #             artist.set_linestyle(linestyle)
-        #         if linewidth:
-        #             artist.set_linewidth(linewidth)
-    traverse_layout(artist, handle_artist)
\ No newline at end of file
+    # The figure is the same for the whole hierarchy, so look it up once
+    fig = artist.get_figure()
+    # Debug boxes are gathered into a single PatchCollection and added to the figure once, rather than adding one Rectangle artist per box
+    rects = []
+    for child, _, _ in iter_layout(artist):
+        bbox = child.get_window_extent(renderer)
+        # Skip boxes that lie entirely outside the figure, since they would never be visible
+        if Bbox.intersection(bbox, fig.bbox) is None:
+            continue
+        # As in add_debug_box, the handler's style is passed on to the Rectangle as is, falling back to the default style if it's empty
+        style = handler(child) or _DEFAULT_DEBUG_STYLE
+        rect = Rectangle((bbox.x0, bbox.y0), bbox.width, bbox.height, **style)
+        if _COLLECTION_STYLE_KEYS.issuperset(style):
+            rects.append(rect)
+        else:
+            # Other properties, such as hatch, can't vary between the patches of a collection, so draw this box as its own artist
+            fig.add_artist(rect)
+    fig.add_artist(PatchCollection(rects, match_original = True))
@@ -2,74 +2,282 @@
 # Implements a custom solution for loading svg file contents into a matplotlib Path
 
 import svgpathtools as svg
-from matplotlib.path import Path
+import copy
+import functools
+import os
 import re
+from matplotlib.path import Path
+import numpy as np
+from xml.dom import minidom
 
-def svg_path_to_matplotlib_path(svg_path: svg.Path) -> Path:
-    # Creates a list of path commands in SVG's path language.
-    # This method seems to defeat the purpose of using a 3rd party utility - why not just parse the raw SVG path into a matplotlib path?
-    # Because the 3rd party library normalizes the format of the svg path, reducing it to only a small fraction of the total complexity of parsing an svg path.
-    commands = svg_path.d()
-    commands = re.split('([A-Z])', commands)[1:]
-    vertices = []
-    codes = []
-    for command, args in zip(commands[::2], commands[1::2]):
-        #print(command, args)
-        points = [x for x in args.split(' ') if x != '']
-        points = [point_str.split(',') for point_str in points]
-        points = [(float(p[0]), float(p[1])) for p in points]
-        path_command = ''
-        if command == 'M':
-            path_command = Path.MOVETO
-        elif command == 'L':
-            path_command = Path.LINETO
-        elif command == 'C':
-            path_command = Path.CURVE4
-        elif command == 'Q':
-            path_command = Path.CURVE3
+# Maps normalized svg path commands (as emitted by svgpathtools) to matplotlib path codes
+_PATH_COMMANDS = {
+    'M': Path.MOVETO,
+    'L': Path.LINETO,
+    'C': Path.CURVE4,
+    'Q': Path.CURVE3,
+}
+
+# Splits path data at command letters. 'e' and 'E' are excluded because they mark a number's exponent.
+_COMMAND_SPLIT = re.compile('([A-DF-Za-df-z])')
+# Splits a command's arguments around numbers, following svg's grammar: [sign] digits [. digits] [(e|E) [sign] digits].
+# Matching is greedy, so a second '.' or a sign starts a new number: '1.2.3' reads as 1.2, .3 and '7.9-1.71' as 7.9, -1.71.
+_NUMBER_SPLIT = re.compile(r'([-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?)')
+_SEPARATORS = ' ,\t\r\n'
+# Path data made only of ascii command letters, number characters and separators. float() also accepts other digits and '_', so anything else goes through _NUMBER_SPLIT
+_PLAIN_PATH_DATA = re.compile(r'[A-Za-z0-9.+\-, \t\r\n]*')
+
+def _tokenize_path(d: str):
+    """
+    Splits raw svg path data into its commands, returning a list of command letters, an array with the number of arguments of each command and a float64 array of all arguments.
+    Accepts every svg path command, absolute or relative. Splitting is done by str/re methods and all numbers are converted by one numpy call, so there is no per-character python work.
+    """
+    parts = _COMMAND_SPLIT.split(d)
+    if parts[0].strip(_SEPARATORS):
+        raise ValueError(f'Path data must begin with a command: {d}')
+    arguments = parts[2::2]
+    if _PLAIN_PATH_DATA.fullmatch(d):
+        # Common case: numbers are delimited by separators, so splitting on those is enough
+        numbers = []
+        counts = []
+        for args in arguments:
+            pieces = args.replace(',', ' ').split()
+            numbers += pieces
+            counts.append(len(pieces))
+        try:
+            values = np.array(numbers, dtype = np.float64)
+        except ValueError:
+            # Compact forms such as '1.2.3' or '7.9-1.71' aren't delimited by separators, so fall through to the full number grammar
+            pass
         else:
-            raise ValueError(f'Unrecognized path command: {command}') 
-        vertices.extend(points)
-        codes.extend([path_command] * len(points))
+            return parts[1::2], np.array(counts, dtype = np.intp), values
+    numbers = []
+    counts = []
+    for args in arguments:
+        pieces = _NUMBER_SPLIT.split(args)
+        # Anything between numbers other than separators is malformed, e.g. '1e' or a lone '-'
+        if ''.join(pieces[::2]).strip(_SEPARATORS):
+            raise ValueError(f'Invalid path data: {args}')
+        numbers += pieces[1::2]
+        counts.append(len(pieces) // 2)
+    values = np.array(numbers, dtype = np.float64)
+    return parts[1::2], np.array(counts, dtype = np.intp), values
+
+# Number of arguments taken by each svg path command handled by _normalize_d. Arcs (A) are left to svgpathtools.
+_COMMAND_ARITY = { 'M': 2, 'L': 2, 'H': 1, 'V': 1, 'C': 6, 'S': 4, 'Q': 4, 'T': 2, 'Z': 0 }
+# Most vertices that one repetition of each command adds in _normalize_d, counting the MOVETO that may precede it
+_COMMAND_MAX_VERTICES = { 'M': 2, 'L': 2, 'H': 2, 'V': 2, 'C': 4, 'S': 4, 'Q': 3, 'T': 3, 'Z': 2 }
+# Path codes as python ints, for writing into memoryviews
+_MOVETO, _LINETO, _CURVE3, _CURVE4 = int(Path.MOVETO), int(Path.LINETO), int(Path.CURVE3), int(Path.CURVE4)
+# Arc commands in path data. 'a' and 'A' can't appear in numbers, so a plain search is enough.
+_ARC_COMMAND = re.compile('[Aa]')
+
+def _normalize_d(d: str):
+    """
+    Converts raw svg path data into matplotlib vertices and codes, using only the MOVETO, LINETO, CURVE3 and CURVE4 codes that svgpathtools' normalized path data maps to.
+    Relative commands are resolved against the current point, H/V are expanded to lines and S/T control points are reflected per the svg spec. Arc commands aren't supported; read_svg leaves path data with arcs to svgpathtools.
+    Returns an (N, 2) array of vertices and an (N,) array of path codes.
+    """
+    commands, counts, values = _tokenize_path(d)
+    values = values.tolist()
+    counts = counts.tolist()
+    # First pass: bound the number of vertices from the argument counts, so that the output arrays are allocated once and filled in place
+    bound = 0
+    for command, count in zip(commands, counts):
+        upper = command.upper()
+        arity = _COMMAND_ARITY.get(upper)
+        bound += _COMMAND_MAX_VERTICES.get(upper, 0) * (count // arity if arity else 1)
+    vertices = np.empty((bound, 2), dtype = np.float64)
+    codes = np.empty(bound, dtype = Path.code_type)
+    # Item assignment through memoryviews is much cheaper than through numpy indexing
+    xy = memoryview(vertices.reshape(-1))
+    code = memoryview(codes)
+    n = 0 # number of vertices written
+    def add(x, y, path_code):
+        nonlocal n
+        xy[2 * n] = x
+        xy[2 * n + 1] = y
+        code[n] = path_code
+        n += 1
+    # Second pass: fill in the vertices
+    x = y = 0.0 # current point
+    start_x = start_y = 0.0 # start of the current subpath, returned to by Z
+    end_x = end_y = None # end of the last emitted segment
+    control_x = control_y = 0.0 # last control point of the previous segment, for S/T reflection
+    previous = None # previous command, for S/T reflection
+    offset = 0
+    for command, count in zip(commands, counts):
+        args = values[offset:offset + count]
+        offset += count
+        upper = command.upper()
+        arity = _COMMAND_ARITY.get(upper)
+        if arity is None:
+            raise ValueError(f'Unrecognized path command: {command}')
+        if upper == 'Z':
+            if count:
+                raise ValueError(f'Wrong number of arguments for path command {command}: {args}')
+            if x != start_x or y != start_y:
+                if x != end_x or y != end_y:
+                    add(x, y, _MOVETO)
+                add(start_x, start_y, _LINETO)
+                end_x, end_y = start_x, start_y
+            x, y = start_x, start_y
+            previous = 'Z'
+            continue
+        if not count or count % arity:
+            raise ValueError(f'Wrong number of arguments for path command {command}: {args}')
+        relative = command != upper
+        # Relative commands are offset from the current point at the start of each repetition
+        for j in range(0, count, arity):
+            ox, oy = (x, y) if relative else (0.0, 0.0)
+            if upper == 'M' and j == 0:
+                x = start_x = args[j] + ox
+                y = start_y = args[j + 1] + oy
+                previous = 'M'
+                continue
+            # Like svgpathtools, only emit a move when a segment doesn't continue from the previous one
+            if x != end_x or y != end_y:
+                add(x, y, _MOVETO)
+            if upper in 'ML':
+                # Extra coordinate pairs after a move are implicit line commands
+                x, y = args[j] + ox, args[j + 1] + oy
+                add(x, y, _LINETO)
+            elif upper == 'H':
+                x = args[j] + ox
+                add(x, y, _LINETO)
+            elif upper == 'V':
+                y = args[j] + oy
+                add(x, y, _LINETO)
+            elif upper == 'C':
+                control_x, control_y = args[j + 2] + ox, args[j + 3] + oy
+                add(args[j] + ox, args[j + 1] + oy, _CURVE4)
+                add(control_x, control_y, _CURVE4)
+                x, y = args[j + 4] + ox, args[j + 5] + oy
+                add(x, y, _CURVE4)
+            elif upper == 'S':
+                if previous in ('C', 'S'):
+                    add(2 * x - control_x, 2 * y - control_y, _CURVE4)
+                else:
+                    add(x, y, _CURVE4)
+                control_x, control_y = args[j] + ox, args[j + 1] + oy
+                x, y = args[j + 2] + ox, args[j + 3] + oy
+                add(control_x, control_y, _CURVE4)
+                add(x, y, _CURVE4)
+            else: # Q or T
+                if upper == 'Q':
+                    control_x, control_y = args[j] + ox, args[j + 1] + oy
+                    x, y = args[j + 2] + ox, args[j + 3] + oy
+                elif previous in ('Q', 'T'):
+                    control_x, control_y = 2 * x - control_x, 2 * y - control_y
+                    x, y = args[j] + ox, args[j + 1] + oy
+                else:
+                    control_x, control_y = x, y
+                    x, y = args[j] + ox, args[j + 1] + oy
+                add(control_x, control_y, _CURVE3)
+                add(x, y, _CURVE3)
+            end_x, end_y = x, y
+            previous = upper
+    return vertices[:n], codes[:n]
+
+def d_to_matplotlib_path(d: str) -> Path:
+    """
+    Converts raw svg path data (the 'd' attribute of a <path> element) into a matplotlib Path, without going through svgpathtools.
+    """
+    vertices, codes = _normalize_d(d)
     return Path(vertices, codes)
 
-def read_svg(file: str, invert_y = True, height = None):
+def _parse_normalized_path(d: str):
     """
-    Opens an svg file and returns a Path matplotlib representation for output in a plot and underlying csv file metadata.
+    Parses normalized svg path data (M, L, C and Q commands, as emitted by svgpathtools), returning an (N, 2) array of vertices and an (N,) array of matplotlib path codes.
+    Tokenizing is left to _tokenize_path, so compact numbers such as '1.2.3' (1.2, .3), '7.9-1.71' (7.9, -1.71) and '1e-4' are read correctly. Codes are expanded per vertex with numpy.
+    """
+    commands, counts, values = _tokenize_path(d)
+    path_commands = [_PATH_COMMANDS.get(command) for command in commands]
+    if None in path_commands:
+        raise ValueError(f'Unrecognized path command: {commands[path_commands.index(None)]}')
+    if (counts % 2).any():
+        raise ValueError(f'Odd number of coordinates in path: {d}')
+    codes = np.repeat(np.array(path_commands, dtype = Path.code_type), counts // 2)
+    return values.reshape(-1, 2), codes
 
-    Parameters:
-        - invert_y: if true, flip y coordinates of the underlying svg for matplotlib, converting from screen space (y origin at top) to figure space (y origin at bottom). if false, graphics will appear upside-down when attaching them to a plot.
-        - height: if set, scale the resulting path to fit a specified height
-    Returns:
-        Path: a matplotlib path that can be added to a plot using PathPatch to display the svg
+def svg_path_to_matplotlib_path(svg_path: svg.Path) -> Path:
+    # Creates a list of path commands in SVG's path language.
+    # The 3rd party library normalizes the format of the svg path, reducing it to only a small fraction of the total complexity of parsing an svg path.
+    # Plain path data is normalized by _normalize_d instead (see d_to_matplotlib_path), so this is only used for svg shapes and arcs, which need svgpathtools.
+    vertices, codes = _parse_normalized_path(svg_path.d())
+    return Path(vertices, codes)
+
+# svg elements that svgpathtools converts to paths, but that aren't handled by d_to_matplotlib_path
+_SHAPE_ELEMENTS = ('line', 'polyline', 'polygon', 'rect', 'circle', 'ellipse')
+
+# viewBox values may be separated by whitespace and/or a comma
+_VIEWBOX_SEPARATOR = re.compile(r'[\s,]+')
+
+def _read_svg_paths(file: str):
+    """
+    Reads all paths in an svg file as matplotlib Paths, along with the attributes of the root svg element.
+    Path data is parsed directly. svgpathtools is only used for files with other shapes, which it converts to paths, or with arc commands.
     """
+    doc = minidom.parse(file)
+    svg_attributes = dict(doc.getElementsByTagName('svg')[0].attributes.items())
+    path_data = [element.getAttribute('d') for element in doc.getElementsByTagName('path')]
+    needs_svgpathtools = any(doc.getElementsByTagName(tag) for tag in _SHAPE_ELEMENTS) or any(_ARC_COMMAND.search(d) for d in path_data)
+    doc.unlink()
+    if needs_svgpathtools:
+        paths, _, svg_attributes = svg.svg2paths(file, return_svg_attributes = True)
+        return [svg_path_to_matplotlib_path(path) for path in paths], svg_attributes
+    return [d_to_matplotlib_path(d) for d in path_data], svg_attributes
 
+@functools.lru_cache(maxsize = 32)
+def _read_svg_cached(abspath: str, mtime_ns: int, invert_y: bool, height):
+    """
+    Does the work of read_svg, returning all paths as a list. Results are cached by file path and modification time, so callers must not modify them.
+    """
     # A note on path transformation:
     # It would have been more desirable to use PathPatch's built-in transformations to flip and scale svg graphics and return a PathPath instead of Path.
     # However, doing this correctly is unexpectedly nontrivial because it involves coordinating with Axes transformations.
     # So, we transform the underlying svg data manually instead of using PathPatch transforms.
-    def transform_vertices(transform: lambda x,y: (x,y), path: Path) -> Path:
-        vertices = [transform(vertex[0], vertex[1]) for vertex in path.vertices.copy()]
-        return Path(vertices, path.codes)
 
-    paths, _, svg_attributes = svg.svg2paths(file, return_svg_attributes = True)
-    paths = [svg_path_to_matplotlib_path(path) for path in paths]
-    viewBox = [int(x) for x in svg_attributes['viewBox'].split(' ')]
+    paths, svg_attributes = _read_svg_paths(abspath)
+    viewBox = [int(x) for x in _VIEWBOX_SEPARATOR.split(svg_attributes['viewBox'].strip())]
     svg_attributes['viewBox'] = viewBox
     width = viewBox[2] - viewBox[0]
 
-    # turn image 'upside down' to convert from svg/screen coordinates (where y axis begins at the top) to matplotlib/math coordinates (where y is from the bottom).
-    img_height = viewBox[3] - viewBox[1]
-    if invert_y:
-        paths = [transform_vertices(lambda x, y: (x, img_height - y), path) for path in paths]
     # rescale if needed
+    img_height = viewBox[3] - viewBox[1]
     if height != None:
         scale = height / img_height
-        paths = [transform_vertices(lambda x, y: (x * scale, y * scale), path) for path in paths]
         width *= scale
     else:
+        scale = 1.0
         height = img_height
+    # turn image 'upside down' to convert from svg/screen coordinates (where y axis begins at the top) to matplotlib/math coordinates (where y is from the bottom).
+    # Flipping and scaling are combined into a single affine transform, vertices @ A + b, applied to each path's whole vertex array
+    sx = scale
+    sy = -scale if invert_y else scale
+    ty = img_height * scale if invert_y else 0.0
+    A = np.array([[sx, 0.0], [0.0, sy]])
+    b = np.array([0.0, ty])
+    paths = [Path(path.vertices @ A + b, path.codes) for path in paths]
     svg_attributes["size"] = (width, height)
+    return paths, svg_attributes
+
+def read_svg(file: str, invert_y = True, height = None):
+    """
+    Opens an svg file and returns a Path matplotlib representation for output in a plot and underlying csv file metadata.
+    Files are only parsed again once they change on disk; repeated calls return copies of previously loaded results.
+
+    Parameters:
+        - invert_y: if true, flip y coordinates of the underlying svg for matplotlib, converting from screen space (y origin at top) to figure space (y origin at bottom). if false, graphics will appear upside-down when attaching them to a plot.
+        - height: if set, scale the resulting path to fit a specified height
+    Returns:
+        Path: a matplotlib path that can be added to a plot using PathPatch to display the svg
+    """
+    abspath = os.path.abspath(file)
+    paths, svg_attributes = _read_svg_cached(abspath, os.stat(abspath).st_mtime_ns, invert_y, height)
+    # Return copies so that callers can't corrupt the cache
+    paths = [Path(path.vertices.copy(), path.codes.copy()) for path in paths]
+    svg_attributes = copy.deepcopy(svg_attributes)
     if len(paths) == 1:
         return paths[0], svg_attributes
     else: